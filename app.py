@@ -1,15 +1,24 @@
 
 import streamlit as st
+import numpy as np
 import pandas as pd
 from datetime import datetime
 from io import BytesIO
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import mm
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Table, TableStyle, Spacer
-import os, re, base64, json, requests
-import msal
+import os, re, base64, functools, json
+# reportlab, msal and requests are imported lazily inside the helpers that
+# need them: they dominate cold-start time and a session that never exports
+# a PDF never pays for them. base64/json stay top-level - stdlib and cheap.
+try:
+    import pybase64
+except ImportError:
+    pybase64 = None
+try:
+    import orjson
+    def _json_dumps(obj) -> bytes:
+        return orjson.dumps(obj)
+except ImportError:
+    def _json_dumps(obj) -> bytes:
+        return json.dumps(obj).encode("utf-8")
 
 st.set_page_config(page_title="Wareneingangsbestellung Rotogal", page_icon="📄", layout="wide")
 
@@ -17,72 +26,95 @@ st.title("📄 Wareneingangsbestellung Rotogal (Microsoft Cloud)")
 st.caption("One‑page A4 PDF. English document. Upload to OneDrive and send email via Microsoft Graph.")
 
 # ---------------- Helpers ----------------
+_EUR_SWAP = str.maketrans({",": ".", ".": ","})
+
 def eur_fmt(x: float) -> str:
     try:
         v = float(x)
     except Exception:
         return ""
-    s = f"{v:,.2f}"
-    s = s.replace(",", "_").replace(".", ",").replace("_", ".")
-    return s
+    # Single-pass en-US -> de-DE grouping swap instead of three replace() copies.
+    return f"{v:,.2f}".translate(_EUR_SWAP)
 
-def scale_mm(widths_mm, target_total_mm):
-    s = sum(widths_mm)
-    if s <= 0:
-        return widths_mm
-    f = target_total_mm / s
-    return [w * f for w in widths_mm]
+_NULL_STRS = frozenset(("", "nan", "none", "null"))
 
 def clean(val):
+    # Called several times per row in the PDF loop; the str branch is the hot
+    # path and skips the try/except-pd.isna dance the general case needed.
     if val is None:
         return ""
+    if isinstance(val, str):
+        sval = val.strip()
+        return "" if sval.lower() in _NULL_STRS else sval
     try:
-        if pd.isna(val):
+        if val != val:  # NaN, without a pandas call
             return ""
-    except Exception:
-        pass
-    sval = str(val).strip()
-    if sval.lower() in ("nan", "none", "null"):
+    except TypeError:  # NA-like scalars whose comparisons refuse a bool
         return ""
-    return sval
+    sval = str(val).strip()
+    return "" if sval.lower() in _NULL_STRS else sval
+
+_FN_STRIP = re.compile(r"[^A-Za-z0-9\-_\s.]")
+_FN_SPACES = re.compile(r"\s+")
 
 def sanitize_filename(name: str) -> str:
     name = (name or "").strip() or "supplier_order"
-    safe = re.sub(r"[^A-Za-z0-9\-\_\s\.]", "", name)
-    safe = re.sub(r"\s+", "_", safe)
+    safe = _FN_STRIP.sub("", name)
+    safe = _FN_SPACES.sub("_", safe)
     if not safe.lower().endswith(".pdf"):
         safe += ".pdf"
     return safe
 
 # ---------------- Microsoft Graph helpers ----------------
+@st.cache_resource(show_spinner=False)
+def _graph_session():
+    # One pooled keep-alive session for all Graph calls: both endpoints live on
+    # graph.microsoft.com, so this avoids a fresh TCP+TLS handshake per call.
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+    return session
+
+@st.cache_resource(show_spinner=False)
+def _msal_app(tenant_id: str, client_id: str, client_secret: str):
+    import msal
+
+    authority = f"https://login.microsoftonline.com/{tenant_id}"
+    return msal.ConfidentialClientApplication(client_id, authority=authority, client_credential=client_secret)
+
+@st.cache_data(ttl=3000, show_spinner=False)
+def _acquire_graph_token(tenant_id: str, client_id: str, client_secret: str) -> str:
+    # ttl stays below the default 3600s AAD token lifetime; failures raise and
+    # are therefore never cached.
+    app = _msal_app(tenant_id, client_id, client_secret)
+    scope = ["https://graph.microsoft.com/.default"]
+    result = app.acquire_token_silent(scope, account=None)
+    if not result:
+        result = app.acquire_token_for_client(scopes=scope)
+    if "access_token" not in result:
+        raise RuntimeError(result.get("error_description") or str(result))
+    return result["access_token"]
+
 def get_graph_token(tenant_id: str, client_id: str, client_secret: str):
     try:
-        authority = f"https://login.microsoftonline.com/{tenant_id}"
-        app = msal.ConfidentialClientApplication(client_id, authority=authority, client_credential=client_secret)
-        scope = ["https://graph.microsoft.com/.default"]
-        result = app.acquire_token_silent(scope, account=None)
-        if not result:
-            result = app.acquire_token_for_client(scopes=scope)
-        if "access_token" in result:
-            return result["access_token"], None
-        else:
-            return None, result.get("error_description") or str(result)
+        return _acquire_graph_token(tenant_id, client_id, client_secret), None
     except Exception as e:
         return None, str(e)
 
-def onedrive_upload_file(access_token: str, user_upn: str, folder_path: str, filename: str, file_bytes: bytes):
+def _b64encode_str(data) -> str:
+    if pybase64 is not None:
+        return pybase64.b64encode_as_string(data)
+    return base64.b64encode(data).decode("utf-8")
+
+def _drive_upload_path(user_upn: str, folder_path: str, filename: str) -> str:
     folder_path = (folder_path or "").strip("/")
     if folder_path:
-        url = f"https://graph.microsoft.com/v1.0/users/{user_upn}/drive/root:/{folder_path}/{filename}:/content"
-    else:
-        url = f"https://graph.microsoft.com/v1.0/users/{user_upn}/drive/root:/{filename}:/content"
-    headers = {"Authorization": f"Bearer {access_token}", "Content-Type": "application/pdf"}
-    r = requests.put(url, headers=headers, data=file_bytes, timeout=60)
-    return r.status_code, r.text
+        return f"/users/{user_upn}/drive/root:/{folder_path}/{filename}:/content"
+    return f"/users/{user_upn}/drive/root:/{filename}:/content"
 
-def graph_send_mail(access_token: str, sender_upn: str, to_emails: list, subject: str, body_html: str, attachment_bytes: bytes = None, attachment_name: str = "order.pdf"):
-    url = f"https://graph.microsoft.com/v1.0/users/{sender_upn}/sendMail"
-    headers = {"Authorization": f"Bearer {access_token}", "Content-Type": "application/json"}
+def _mail_message(to_emails: list, subject: str, body_html: str, attachment_b64: str = None, attachment_name: str = "order.pdf", attachment_url: str = None):
     message = {
         "message": {
             "subject": subject,
@@ -91,17 +123,265 @@ def graph_send_mail(access_token: str, sender_upn: str, to_emails: list, subject
         },
         "saveToSentItems": True
     }
-    if attachment_bytes:
-        content_b64 = base64.b64encode(attachment_bytes).decode("utf-8")
+    if attachment_url:
+        # Reference attachment: the mail carries a link to the drive item
+        # instead of 4/3 of the PDF as base64.
+        message["message"]["attachments"] = [{
+            "@odata.type": "#microsoft.graph.referenceAttachment",
+            "name": attachment_name,
+            "sourceUrl": attachment_url,
+            "providerType": "oneDriveBusiness"
+        }]
+    elif attachment_b64:
         message["message"]["attachments"] = [{
             "@odata.type": "#microsoft.graph.fileAttachment",
             "name": attachment_name,
             "contentType": "application/pdf",
-            "contentBytes": content_b64
+            "contentBytes": attachment_b64
         }]
-    r = requests.post(url, headers=headers, data=json.dumps(message), timeout=60)
+    return message
+
+def onedrive_upload_file(access_token: str, user_upn: str, folder_path: str, filename: str, file_bytes: bytes):
+    url = "https://graph.microsoft.com/v1.0" + _drive_upload_path(user_upn, folder_path, filename)
+    headers = {"Authorization": f"Bearer {access_token}", "Content-Type": "application/pdf"}
+    r = _graph_session().put(url, headers=headers, data=file_bytes, timeout=60)
     return r.status_code, r.text
 
+def onedrive_create_link(access_token: str, user_upn: str, item_id: str):
+    """Create an organization-scoped view link for a drive item.
+
+    Returns (status_code, link_url_or_None, raw_text).
+    """
+    url = f"https://graph.microsoft.com/v1.0/users/{user_upn}/drive/items/{item_id}/createLink"
+    headers = {"Authorization": f"Bearer {access_token}", "Content-Type": "application/json"}
+    r = _graph_session().post(url, headers=headers, data=_json_dumps({"type": "view", "scope": "organization"}), timeout=60)
+    link_url = None
+    if 200 <= r.status_code < 300:
+        try:
+            link_url = r.json()["link"]["webUrl"]
+        except (ValueError, KeyError, TypeError):
+            pass
+    return r.status_code, link_url, r.text
+
+def graph_send_mail(access_token: str, sender_upn: str, to_emails: list, subject: str, body_html: str, attachment_bytes: bytes = None, attachment_name: str = "order.pdf", attachment_url: str = None):
+    url = f"https://graph.microsoft.com/v1.0/users/{sender_upn}/sendMail"
+    headers = {"Authorization": f"Bearer {access_token}", "Content-Type": "application/json"}
+    attachment_b64 = None
+    if attachment_bytes and not attachment_url:
+        attachment_b64 = _b64encode_str(attachment_bytes)
+    message = _mail_message(to_emails, subject, body_html, attachment_b64, attachment_name, attachment_url)
+    r = _graph_session().post(url, headers=headers, data=_json_dumps(message), timeout=60)
+    return r.status_code, r.text
+
+# ---------------- PDF build ----------------
+@functools.lru_cache(maxsize=1)
+def _static_styles():
+    # Styles are immutable for our purposes, so build them once per process
+    # instead of re-registering the whole sample stylesheet on every PDF.
+    # Built on first export so ReportLab stays out of the cold-start path.
+    from reportlab.lib import colors
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.platypus import TableStyle
+
+    styles = getSampleStyleSheet()
+    styles.add(ParagraphStyle(name="Small", fontSize=7, leading=8.5))
+    styles.add(ParagraphStyle(name="Normal8", fontSize=8, leading=10))
+    styles.add(ParagraphStyle(name="Header", fontSize=12, leading=14, spaceAfter=4))
+
+    title_table_style = TableStyle([
+        ("VALIGN", (0,0), (-1,-1), "TOP"),
+        ("BOTTOMPADDING", (0,0), (-1,-1), 2),
+        ("TOPPADDING", (0,0), (-1,-1), 0),
+    ])
+    meta_table_style = TableStyle([
+        ("VALIGN", (0,0), (-1,-1), "TOP"),
+        ("BOX", (0,0), (-1,-1), 0.25, colors.black),
+        ("INNERGRID", (0,0), (-1,-1), 0.25, colors.black),
+        ("BACKGROUND", (0,0), (-1,-1), colors.whitesmoke),
+        ("LEFTPADDING", (0,0), (-1,-1), 2),
+        ("RIGHTPADDING", (0,0), (-1,-1), 2),
+        ("TOPPADDING", (0,0), (-1,-1), 1),
+        ("BOTTOMPADDING", (0,0), (-1,-1), 1),
+    ])
+    footer_table_style = TableStyle([
+        ("VALIGN", (0,0), (-1,-1), "TOP"),
+        ("LEFTPADDING", (0,0), (-1,-1), 1),
+        ("RIGHTPADDING", (0,0), (-1,-1), 1),
+    ])
+    return styles, title_table_style, meta_table_style, footer_table_style
+
+@functools.lru_cache(maxsize=1)
+def _col_widths_pts():
+    # The line-table geometry is fixed: seven base widths scaled to a 180 mm
+    # table, converted to points. Fold it once instead of per build.
+    from reportlab.lib.units import mm
+
+    base_mm = np.array([10, 18, 85, 35, 12, 30, 30], dtype=np.float64)
+    return (base_mm * (180.0 / base_mm.sum()) * mm).tolist()
+
+@functools.lru_cache(maxsize=8)
+def _cell_style(font_size: int):
+    from reportlab.lib.styles import ParagraphStyle
+
+    return ParagraphStyle(name="Cell", fontSize=font_size, leading=font_size + 1)
+
+@functools.lru_cache(maxsize=4)
+def _tiny_style(font_size: int):
+    from reportlab.lib.styles import ParagraphStyle
+
+    return ParagraphStyle(name=f"Tiny{font_size}", fontSize=font_size, leading=font_size + 1)
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def build_pdf_cached(meta_tuple: tuple, cols_tuple: tuple) -> bytes:
+    # Hashable inputs so the rendered PDF is reused across reruns whenever
+    # neither the meta nor the line items changed. The session column store is
+    # consumed as-is - no DataFrame round-trip, whose Index/Block allocation
+    # and per-row boxing bought nothing here.
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import mm
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Table, TableStyle, Spacer
+
+    meta = dict(meta_tuple)
+    cols = dict(cols_tuple)
+    n_rows = len(cols["Product group"]) if cols else 0
+    left_margin = 15*mm
+    right_margin = 15*mm
+    top_margin = 12*mm
+    bottom_margin = 12*mm
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, leftMargin=left_margin, rightMargin=right_margin,
+                            topMargin=top_margin, bottomMargin=bottom_margin)
+    styles, title_table_style, meta_table_style, footer_table_style = _static_styles()
+
+    rows = max(1, n_rows)
+    body_font = 8 if rows <= 18 else (7 if rows <= 24 else 6)
+    small_font = 7 if body_font >= 7 else 6
+
+    story = []
+
+    right_header = f"<b>Order</b><br/>Our Order No.: {meta.get('order_no','')}"
+    if meta.get('your_order_ref'):
+        right_header += f"<br/>Your order ref.: {meta.get('your_order_ref')}"
+    right_header += f"<br/>VAT ID: {meta.get('vat_id','')}"
+
+    title_table = Table([
+        [
+            Paragraph("<b>ROTOGAL, S.L.U.</b><br/>POL. IND. ESPIÑERIA, PARC.36B<br/>15930 Boiro, A Coruña<br/>Spain", styles["Normal8"]),
+            Paragraph(right_header, styles["Normal8"]),
+        ]
+    ], colWidths=[100*mm, 70*mm])
+    title_table.setStyle(title_table_style)
+    story.append(title_table)
+    story.append(Spacer(1, 3))
+
+    shipping_html = clean(meta["ship_to"]).replace("\n","<br/>") if meta["ship_to"] else ""
+    billing_html = clean(meta["bill_to"]).replace("\n","<br/>")
+    meta_table = Table([
+        [
+            Paragraph("<b>Shipping address:</b><br/>%s" % shipping_html, styles["Normal8"]),
+            Paragraph("<b>Billing address:</b><br/>%s" % billing_html, styles["Normal8"]),
+            Paragraph("Page: 1<br/>Date: %s<br/>Contact person: %s" % (meta["date_str"], meta["contact_person"]), styles["Normal8"]),
+        ]
+    ], colWidths=[65*mm, 65*mm, 40*mm])
+    meta_table.setStyle(meta_table_style)
+    story.append(meta_table)
+    story.append(Spacer(1, 4))
+
+    col_w_pts = _col_widths_pts()
+
+    header = ["Pos.", "Quantity", "Article", "Note", "VAT %", "Net price (EUR)", "Total (EUR)"]
+    data = [header]
+    net_sum = 0.0
+    vat_rate = meta["vat_rate"]
+    vat_pct_str = f"{int(vat_rate*100)}%"
+    cell_style = _cell_style(body_font)
+    rows_iter = zip(cols["Product group"], cols["Quantity"], cols["Model"], cols["Color"],
+                    cols["Wall build"], cols["Drain"], cols["Note"], cols["Net price"], cols["Total"])
+    for pos, (pg, qty, model, color, wall, drain, note, net, total) in enumerate(rows_iter, start=1):
+        pg = clean(pg)
+        model = clean(model)
+        color = clean(color)
+        wall = clean(wall)
+        drain = clean(drain)
+        note = clean(note)
+
+        parts = []
+        if pg: parts.append(pg)
+        if model: parts.append(f"Mod. {model}")
+        if wall: parts.append(f"({wall})")
+        if color: parts.append(color)
+        if pg == "Bins" and drain and drain.lower() != "none":
+            parts.append(f"drain: {drain}")
+
+        article = ", ".join(parts)
+        net = float(net or 0.0)
+        total = float(total or 0.0)
+        net_sum += total
+        data.append([
+            str(pos),
+            str(int(qty or 0)),
+            Paragraph(article, cell_style),
+            Paragraph(note, cell_style),
+            vat_pct_str,
+            eur_fmt(net),
+            eur_fmt(total)
+        ])
+
+    tbl = Table(data, colWidths=col_w_pts, repeatRows=1)
+    tbl.setStyle(TableStyle([
+        ("GRID", (0,0), (-1,-1), 0.25, colors.black),
+        ("BACKGROUND", (0,0), (-1,0), colors.whitesmoke),
+        ("ALIGN", (0,0), (-1,0), "CENTER"),
+        ("VALIGN", (0,0), (-1,-1), "TOP"),
+        ("FONTSIZE", (0,0), (-1,0), body_font),
+        ("FONTSIZE", (0,1), (-1,-1), body_font),
+        ("LEFTPADDING", (0,0), (-1,-1), 2),
+        ("RIGHTPADDING", (0,0), (-1,-1), 2),
+        ("TOPPADDING", (0,0), (-1,-1), 1),
+        ("BOTTOMPADDING", (0,0), (-1,-1), 1),
+        ("ALIGN", (1,1), (1,-1), "RIGHT"),
+        ("ALIGN", (5,1), (6,-1), "RIGHT"),
+    ]))
+    story.append(tbl)
+    story.append(Spacer(1, 4))
+
+    vat_amount = net_sum * vat_rate
+    gross = net_sum + vat_amount
+    totals_table = Table([
+        ["Net price:", eur_fmt(net_sum), "EUR"],
+        [f"VAT ({vat_pct_str}):", eur_fmt(vat_amount), "EUR"],
+        ["Gross price:", eur_fmt(gross), "EUR"],
+    ], colWidths=[60*mm, 30*mm, 30*mm])
+    totals_table.setStyle(TableStyle([
+        ("ALIGN", (0,0), (-1,-1), "RIGHT"),
+        ("FONTSIZE", (0,0), (-1,-1), body_font),
+        ("LEFTPADDING", (0,0), (-1,-1), 2),
+        ("RIGHTPADDING", (0,0), (-1,-1), 2),
+    ]))
+    story.append(totals_table)
+    story.append(Spacer(1, 4))
+
+    tiny_style = _tiny_style(small_font)
+    story.append(Paragraph(
+        "Customer protection, neutrality and on-time delivery are taken for granted. "
+        "Please make sure to give Rotogal reference numbers with any query (invoice, delivery note). "
+        "We kindly ask for a written confirmation of order.",
+        tiny_style
+    ))
+    story.append(Spacer(1, 4))
+
+    footer_right = f"VAT ID: {meta['vat_id']}\n" + meta["footer_right_extra"]
+    footer_table = Table([
+        [Paragraph(meta["footer_left"].replace("\n","<br/>"), tiny_style),
+         Paragraph(footer_right.replace("\n","<br/>"), tiny_style)]
+    ], colWidths=[90*mm, 90*mm])
+    footer_table.setStyle(footer_table_style)
+    story.append(footer_table)
+
+    doc.build(story)
+    return buffer.getvalue()
+
 # ---------------- Sidebar: meta ----------------
 with st.sidebar:
     st.header("Order meta")
@@ -163,14 +443,27 @@ PRODUCT_TYPES = {
 }
 
 # ---------------- Session ----------------
-if "order_lines" not in st.session_state:
-    st.session_state.order_lines = []
+# Struct-of-arrays layout: one flat list per column. DataFrame construction
+# from a dict of homogeneous lists is a single C-level array per column,
+# instead of re-inferring dtypes from a list of heterogeneous dicts per rerun.
+ORDER_COLUMNS = ("Product group", "Quantity", "Model", "Color", "Wall build", "Drain", "Note", "Net price", "Total")
+
+def _empty_order_cols():
+    return {col: [] for col in ORDER_COLUMNS}
+
+if "order_cols" not in st.session_state:
+    st.session_state.order_cols = _empty_order_cols()
 
 def add_line(ptype, data):
-    st.session_state.order_lines.append({"Product group": ptype, **data})
+    row = {"Product group": ptype, **data}
+    for col, values in st.session_state.order_cols.items():
+        values.append(row.get(col, ""))
 
 def reset_lines():
-    st.session_state.order_lines = []
+    st.session_state.order_cols = _empty_order_cols()
+
+def order_line_count():
+    return len(st.session_state.order_cols["Product group"])
 
 st.divider()
 
@@ -221,15 +514,15 @@ st.divider()
 
 # ---------------- Order table + export ----------------
 st.subheader("Order overview")
-if len(st.session_state.order_lines) == 0:
+if order_line_count() == 0:
     st.info("No positions added yet.")
 else:
-    df = pd.DataFrame(st.session_state.order_lines)
+    df = pd.DataFrame(st.session_state.order_cols, copy=False)
     df_display = df.copy()
     if "Net price" in df_display:
-        df_display["Net price"] = df_display["Net price"].apply(eur_fmt)
+        df_display["Net price"] = df_display["Net price"].map(eur_fmt)
     if "Total" in df_display:
-        df_display["Total"] = df_display["Total"].apply(eur_fmt)
+        df_display["Total"] = df_display["Total"].map(eur_fmt)
 
     st.dataframe(df_display, use_container_width=True, hide_index=True)
 
@@ -242,165 +535,6 @@ else:
     with c2:
         auto_filename = sanitize_filename(order_no or "supplier_order")
 
-        def build_pdf(meta, lines_df):
-            left_margin = 15*mm
-            right_margin = 15*mm
-            top_margin = 12*mm
-            bottom_margin = 12*mm
-            buffer = BytesIO()
-            doc = SimpleDocTemplate(buffer, pagesize=A4, leftMargin=left_margin, rightMargin=right_margin,
-                                    topMargin=top_margin, bottomMargin=bottom_margin)
-            styles = getSampleStyleSheet()
-            styles.add(ParagraphStyle(name="Small", fontSize=7, leading=8.5))
-            styles.add(ParagraphStyle(name="Normal8", fontSize=8, leading=10))
-            styles.add(ParagraphStyle(name="Header", fontSize=12, leading=14, spaceAfter=4))
-
-            rows = max(1, len(lines_df))
-            body_font = 8 if rows <= 18 else (7 if rows <= 24 else 6)
-            small_font = 7 if body_font >= 7 else 6
-
-            story = []
-
-            right_header = f"<b>Order</b><br/>Our Order No.: {meta.get('order_no','')}"
-            if meta.get('your_order_ref'):
-                right_header += f"<br/>Your order ref.: {meta.get('your_order_ref')}"
-            right_header += f"<br/>VAT ID: {meta.get('vat_id','')}"
-
-            title_table = Table([
-                [
-                    Paragraph("<b>ROTOGAL, S.L.U.</b><br/>POL. IND. ESPIÑERIA, PARC.36B<br/>15930 Boiro, A Coruña<br/>Spain", styles["Normal8"]),
-                    Paragraph(right_header, styles["Normal8"]),
-                ]
-            ], colWidths=[100*mm, 70*mm])
-            title_table.setStyle(TableStyle([
-                ("VALIGN", (0,0), (-1,-1), "TOP"),
-                ("BOTTOMPADDING", (0,0), (-1,-1), 2),
-                ("TOPPADDING", (0,0), (-1,-1), 0),
-            ]))
-            story.append(title_table)
-            story.append(Spacer(1, 3))
-
-            shipping_html = clean(meta["ship_to"]).replace("\n","<br/>") if meta["ship_to"] else ""
-            billing_html = clean(meta["bill_to"]).replace("\n","<br/>")
-            meta_table = Table([
-                [
-                    Paragraph("<b>Shipping address:</b><br/>%s" % shipping_html, styles["Normal8"]),
-                    Paragraph("<b>Billing address:</b><br/>%s" % billing_html, styles["Normal8"]),
-                    Paragraph("Page: 1<br/>Date: %s<br/>Contact person: %s" % (meta["date_str"], meta["contact_person"]), styles["Normal8"]),
-                ]
-            ], colWidths=[65*mm, 65*mm, 40*mm])
-            meta_table.setStyle(TableStyle([
-                ("VALIGN", (0,0), (-1,-1), "TOP"),
-                ("BOX", (0,0), (-1,-1), 0.25, colors.black),
-                ("INNERGRID", (0,0), (-1,-1), 0.25, colors.black),
-                ("BACKGROUND", (0,0), (-1,-1), colors.whitesmoke),
-                ("LEFTPADDING", (0,0), (-1,-1), 2),
-                ("RIGHTPADDING", (0,0), (-1,-1), 2),
-                ("TOPPADDING", (0,0), (-1,-1), 1),
-                ("BOTTOMPADDING", (0,0), (-1,-1), 1),
-            ]))
-            story.append(meta_table)
-            story.append(Spacer(1, 4))
-
-            base_mm = [10, 18, 85, 35, 12, 30, 30]
-            target_total_mm = 180
-            col_w_mm = scale_mm(base_mm, target_total_mm)
-            col_w_pts = [w*mm for w in col_w_mm]
-
-            header = ["Pos.", "Quantity", "Article", "Note", "VAT %", "Net price (EUR)", "Total (EUR)"]
-            data = [header]
-            pos = 1
-            net_sum = 0.0
-            for _, row in lines_df.iterrows():
-                pg = clean(row.get('Product group',''))
-                model = clean(row.get('Model',''))
-                color = clean(row.get('Color',''))
-                wall = clean(row.get('Wall build',''))
-                drain = clean(row.get('Drain',''))
-                note = clean(row.get('Note',''))
-
-                parts = []
-                if pg: parts.append(pg)
-                if model: parts.append(f"Mod. {model}")
-                if wall: parts.append(f"({wall})")
-                if color: parts.append(color)
-                if pg == "Bins" and drain and drain.lower() != "none":
-                    parts.append(f"drain: {drain}")
-
-                article = ", ".join(parts)
-                net = float(row.get("Net price", 0.0) or 0.0)
-                total = float(row.get("Total", 0.0) or 0.0)
-                net_sum += total
-                data.append([
-                    str(pos),
-                    str(int(row.get("Quantity", 0) or 0)),
-                    Paragraph(article, ParagraphStyle(name="Cell", fontSize=body_font, leading=body_font+1)),
-                    Paragraph(note, ParagraphStyle(name="Cell", fontSize=body_font, leading=body_font+1)),
-                    f"{int(meta['vat_rate']*100)}%",
-                    eur_fmt(net),
-                    eur_fmt(total)
-                ])
-                pos += 1
-
-            tbl = Table(data, colWidths=col_w_pts, repeatRows=1)
-            tbl.setStyle(TableStyle([
-                ("GRID", (0,0), (-1,-1), 0.25, colors.black),
-                ("BACKGROUND", (0,0), (-1,0), colors.whitesmoke),
-                ("ALIGN", (0,0), (-1,0), "CENTER"),
-                ("VALIGN", (0,0), (-1,-1), "TOP"),
-                ("FONTSIZE", (0,0), (-1,0), body_font),
-                ("FONTSIZE", (0,1), (-1,-1), body_font),
-                ("LEFTPADDING", (0,0), (-1,-1), 2),
-                ("RIGHTPADDING", (0,0), (-1,-1), 2),
-                ("TOPPADDING", (0,0), (-1,-1), 1),
-                ("BOTTOMPADDING", (0,0), (-1,-1), 1),
-                ("ALIGN", (1,1), (1,-1), "RIGHT"),
-                ("ALIGN", (5,1), (6,-1), "RIGHT"),
-            ]))
-            story.append(tbl)
-            story.append(Spacer(1, 4))
-
-            vat_amount = net_sum * meta["vat_rate"]
-            gross = net_sum + vat_amount
-            totals_table = Table([
-                ["Net price:", eur_fmt(net_sum), "EUR"],
-                [f"VAT ({int(meta['vat_rate']*100)}%):", eur_fmt(vat_amount), "EUR"],
-                ["Gross price:", eur_fmt(gross), "EUR"],
-            ], colWidths=[60*mm, 30*mm, 30*mm])
-            totals_table.setStyle(TableStyle([
-                ("ALIGN", (0,0), (-1,-1), "RIGHT"),
-                ("FONTSIZE", (0,0), (-1,-1), body_font),
-                ("LEFTPADDING", (0,0), (-1,-1), 2),
-                ("RIGHTPADDING", (0,0), (-1,-1), 2),
-            ]))
-            story.append(totals_table)
-            story.append(Spacer(1, 4))
-
-            styles.add(ParagraphStyle(name="Tiny", fontSize=small_font, leading=small_font+1))
-            story.append(Paragraph(
-                "Customer protection, neutrality and on-time delivery are taken for granted. "
-                "Please make sure to give Rotogal reference numbers with any query (invoice, delivery note). "
-                "We kindly ask for a written confirmation of order.",
-                styles["Tiny"]
-            ))
-            story.append(Spacer(1, 4))
-
-            footer_right = f"VAT ID: {meta['vat_id']}\n" + meta["footer_right_extra"]
-            footer_table = Table([
-                [Paragraph(meta["footer_left"].replace("\n","<br/>"), styles["Tiny"]),
-                 Paragraph(footer_right.replace("\n","<br/>"), styles["Tiny"])]
-            ], colWidths=[90*mm, 90*mm])
-            footer_table.setStyle(TableStyle([
-                ("VALIGN", (0,0), (-1,-1), "TOP"),
-                ("LEFTPADDING", (0,0), (-1,-1), 1),
-                ("RIGHTPADDING", (0,0), (-1,-1), 1),
-            ]))
-            story.append(footer_table)
-
-            doc.build(story)
-            buffer.seek(0)
-            return buffer
-
         meta = {
             "company": company,
             "contact_person": contact_person,
@@ -417,7 +551,11 @@ else:
             "footer_right_extra": footer_right_extra,
         }
 
-        pdf_buffer = build_pdf(meta, pd.DataFrame(st.session_state.order_lines))
+        pdf_bytes = build_pdf_cached(
+            tuple(sorted(meta.items())),
+            tuple((col, tuple(vals)) for col, vals in st.session_state.order_cols.items()),
+        )
+        pdf_buffer = BytesIO(pdf_bytes)
 
         # Microsoft Graph actions
         if (auto_upload or auto_email):
@@ -426,21 +564,49 @@ else:
             else:
                 token, err = get_graph_token(tenant_id, client_id, client_secret)
                 if token:
-                    if auto_upload:
-                        code, txt = onedrive_upload_file(token, graph_user_upn, onedrive_folder, auto_filename, pdf_buffer.getvalue())
-                        if 200 <= code < 300:
+                    to_list = [e.strip() for e in email_to.split(",") if e.strip()]
+                    subj = f"Order {order_no}"
+                    body = f"<p>Hello,</p><p>Please find attached our order <b>{order_no}</b>.</p><p>Best regards,<br>{contact_person}</p>"
+                    if auto_upload and auto_email and to_list:
+                        # The PDF is already in OneDrive, so mail a link to it
+                        # (reference attachment) instead of re-sending the
+                        # document as base64 - no encode CPU, no 4/3-size body.
+                        code, txt = onedrive_upload_file(token, graph_user_upn, onedrive_folder, auto_filename, pdf_bytes)
+                        if not (200 <= code < 300):
+                            st.error(f"OneDrive upload failed ({code}): {txt}")
+                            link_url = None
+                        else:
                             st.success("Uploaded to OneDrive.")
+                            try:
+                                item_id = json.loads(txt)["id"]
+                            except (ValueError, KeyError, TypeError):
+                                item_id = None
+                            link_url = None
+                            if item_id:
+                                _, link_url, _ = onedrive_create_link(token, graph_user_upn, item_id)
+                        if link_url:
+                            code, txt = graph_send_mail(token, graph_user_upn, to_list, subj, body, attachment_name=auto_filename, attachment_url=link_url)
                         else:
-                            st.error(f"OneDrive upload failed ({code}): {txt}")
-                    if auto_email and email_to.strip():
-                        to_list = [e.strip() for e in email_to.split(",") if e.strip()]
-                        subj = f"Order {order_no}"
-                        body = f"<p>Hello,</p><p>Please find attached our order <b>{order_no}</b>.</p><p>Best regards,<br>{contact_person}</p>"
-                        code, txt = graph_send_mail(token, graph_user_upn, to_list, subj, body, pdf_buffer.getvalue(), auto_filename)
+                            # No share link (upload or createLink failed):
+                            # fall back to attaching the PDF itself.
+                            code, txt = graph_send_mail(token, graph_user_upn, to_list, subj, body, pdf_bytes, auto_filename)
                         if 200 <= code < 300:
                             st.success("Email sent via Microsoft Graph.")
                         else:
                             st.error(f"Email send failed ({code}): {txt}")
+                    else:
+                        if auto_upload:
+                            code, txt = onedrive_upload_file(token, graph_user_upn, onedrive_folder, auto_filename, pdf_bytes)
+                            if 200 <= code < 300:
+                                st.success("Uploaded to OneDrive.")
+                            else:
+                                st.error(f"OneDrive upload failed ({code}): {txt}")
+                        if auto_email and to_list:
+                            code, txt = graph_send_mail(token, graph_user_upn, to_list, subj, body, pdf_bytes, auto_filename)
+                            if 200 <= code < 300:
+                                st.success("Email sent via Microsoft Graph.")
+                            else:
+                                st.error(f"Email send failed ({code}): {txt}")
                 else:
                     st.error(f"Graph auth failed: {err or 'Unknown error'}")
 